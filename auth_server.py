@@ -1,12 +1,17 @@
 """Flask OAuth callback server for Whoop authentication."""
+import logging
 from flask import Flask, request, redirect, session, jsonify
 from whoop_auth import WhoopAuth
+from whoop_client import WhoopClient
 import config
 
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
 app = Flask(__name__)
 app.secret_key = config.FLASK_SECRET_KEY
 
 auth = WhoopAuth()
+client = WhoopClient(auth)
 
 
 @app.route('/')
@@ -75,8 +80,6 @@ def test_api():
         return redirect('/login')
     
     try:
-        from whoop_client import WhoopClient
-        client = WhoopClient(auth)
         profile = client.get_user_profile()
         return jsonify({
             'status': 'success',
@@ -1,18 +1,39 @@
 """Configuration settings for the Whoop Health Data Comparison Application."""
+import functools
 import os
+import sys
 from datetime import datetime
 
+
+def _try_streamlit_secrets():
+    """
+    Return Streamlit secrets, importing Streamlit only when it can supply them.
+    
+    Streamlit is heavy to import, so processes that don't already run it
+    (e.g. the Flask auth server) skip it unless a secrets.toml file exists.
+    """
+    secrets_files = [
+        os.path.join('.streamlit', 'secrets.toml'),
+        os.path.join(os.path.expanduser('~'), '.streamlit', 'secrets.toml')
+    ]
+    if 'streamlit' not in sys.modules and not any(os.path.exists(f) for f in secrets_files):
+        raise ImportError("Streamlit secrets not available")
+    
+    import streamlit as st
+    return st.secrets
+
+
 # Try Streamlit secrets first (for cloud deployment), fall back to .env (for local)
 try:
-    import streamlit as st
-    WHOOP_CLIENT_ID = st.secrets["whoop"]["client_id"]
-    WHOOP_CLIENT_SECRET = st.secrets["whoop"]["client_secret"]
-    WHOOP_REDIRECT_URI = st.secrets["whoop"]["redirect_uri"]
-    FLASK_SECRET_KEY = st.secrets["app"]["secret_key"]
-    DATA_START_DATE = st.secrets.get("app", {}).get("data_start_date", "2026-01-01")
-    DATA_END_DATE = st.secrets.get("app", {}).get("data_end_date", "2026-02-10")
-    CARDIAC_ARREST_DATE = st.secrets.get("events", {}).get("cardiac_arrest_date", "2026-01-11")
-    TRIPLE_BYPASS_DATE = st.secrets.get("events", {}).get("triple_bypass_date", "2026-01-19")
+    secrets = _try_streamlit_secrets()
+    WHOOP_CLIENT_ID = secrets["whoop"]["client_id"]
+    WHOOP_CLIENT_SECRET = secrets["whoop"]["client_secret"]
+    WHOOP_REDIRECT_URI = secrets["whoop"]["redirect_uri"]
+    FLASK_SECRET_KEY = secrets["app"]["secret_key"]
+    DATA_START_DATE = secrets.get("app", {}).get("data_start_date", "2026-01-01")
+    DATA_END_DATE = secrets.get("app", {}).get("data_end_date", "2026-02-10")
+    CARDIAC_ARREST_DATE = secrets.get("events", {}).get("cardiac_arrest_date", "2026-01-11")
+    TRIPLE_BYPASS_DATE = secrets.get("events", {}).get("triple_bypass_date", "2026-01-19")
 except (ImportError, FileNotFoundError, KeyError):
     # Fallback to .env for local development
     from dotenv import load_dotenv
@@ -25,6 +46,18 @@ except (ImportError, FileNotFoundError, KeyError):
     DATA_END_DATE = os.getenv('DATA_END_DATE', '2026-02-10')
     CARDIAC_ARREST_DATE = os.getenv('CARDIAC_ARREST_DATE', '2026-01-11')
     TRIPLE_BYPASS_DATE = os.getenv('TRIPLE_BYPASS_DATE', '2026-01-19')
+
+# Whoop API Configuration
+WHOOP_AUTH_URL = 'https://api.prod.whoop.com/oauth/oauth2/auth'
+WHOOP_TOKEN_URL = 'https://api.prod.whoop.com/oauth/oauth2/token'
+WHOOP_API_BASE_URL = 'https://api.prod.whoop.com/developer'
+
+# OAuth Scopes
+WHOOP_SCOPES = [
+    'read:recovery',
+    'read:cycles',
+    'read:workout',
+    'read:sleep',
     'read:profile',
     'read:body_measurement',
     'offline'  # For refresh token
@@ -54,11 +87,42 @@ CRITICAL_EVENTS = [
     }
 ]
 
+# Parse event dates once so charts and processors don't re-run strptime per render
+for _event in CRITICAL_EVENTS:
+    _event['date_dt'] = datetime.strptime(_event['date'], '%Y-%m-%d')
+
+# Column dtypes of the combined daily metrics (see combine_daily_metrics)
+DAILY_DTYPES = {
+    'recovery_score': 'float32',
+    'hrv_rmssd': 'float32',
+    'resting_hr': 'float32',
+    'spo2': 'float32',
+    'skin_temp': 'float32',
+    'sleep_performance': 'float32',
+    'sleep_efficiency': 'float32',
+    'sleep_consistency': 'float32',
+    'total_sleep_hours': 'float32',
+    'light_sleep_hours': 'float32',
+    'deep_sleep_hours': 'float32',
+    'rem_sleep_hours': 'float32',
+    'awake_hours': 'float32',
+    'respiratory_rate': 'float32',
+    'disturbance_count': 'float32',
+    'sleep_cycle_count': 'float32',
+    'day_strain': 'float32',
+    'avg_hr': 'float32',
+    'max_hr': 'float32',
+    'kilojoules': 'float32'
+}
+
 # File Paths
 HEALTH_DATA_DIR = 'health-data'
 DATA_OUTPUT_DIR = 'data'
 TOKENS_DIR = 'tokens'
 
-# Ensure directories exist
-os.makedirs(DATA_OUTPUT_DIR, exist_ok=True)
-os.makedirs(TOKENS_DIR, exist_ok=True)
+
+@functools.lru_cache(maxsize=1)
+def ensure_directories():
+    """Create the data and token directories, once per process, before first write."""
+    os.makedirs(DATA_OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TOKENS_DIR, exist_ok=True)
@@ -1,19 +1,21 @@
 """Interactive dashboard for visualizing Whoop and lab data correlations."""
+import logging
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from datetime import datetime
 import os
 import json
 import config
-from whoop_auth import WhoopAuth
 from whoop_client import WhoopClient
 from lab_parser import LabDataParser
 from data_processor import HealthDataProcessor
-from streamlit_oauth import handle_oauth_flow, show_login_button, show_logout_button
+from streamlit_oauth import get_auth, handle_oauth_flow, show_login_button, show_logout_button
 
 
+# Route module loggers (lab parsing, Whoop fetches) to a single stderr handler
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
 # Page configuration
 st.set_page_config(
     page_title="Whoop Health Data Analysis",
@@ -28,31 +30,90 @@ st.title("❤️ Whoop Health Data Comparison Dashboard")
 st.markdown("### Comparing Whoop metrics with lab test results during cardiac events")
 
 
-@st.cache_data
+@st.cache_resource(ttl=3600, show_spinner=False)
 def load_data():
-    """Load processed data from files."""
+    """
+    Load processed data from files.
+    
+    The returned frames are shared across sessions and reruns without being
+    copied or hashed, so callers must not mutate them in place; take a
+    ``.copy()`` first.
+    
+    Returns:
+        Tuple of (daily_metrics, lab_data, data_version), where data_version
+        identifies the files read (path, mtime and size) for keying caches
+    """
     data_dir = config.DATA_OUTPUT_DIR
     
     daily_metrics = None
     lab_data = None
+    data_version = []
     
-    # Try to load existing processed data
-    daily_path = os.path.join(data_dir, 'daily_metrics.csv')
-    lab_path = os.path.join(data_dir, 'lab_data.csv')
+    # Try to load existing processed data, preferring Parquet (dtypes are
+    # preserved) over CSV files written by older versions
+    daily_path = os.path.join(data_dir, 'daily_metrics.parquet')
+    lab_path = os.path.join(data_dir, 'lab_data.parquet')
     
     if os.path.exists(daily_path):
-        daily_metrics = pd.read_csv(daily_path)
-        daily_metrics['date'] = pd.to_datetime(daily_metrics['date'])
+        data_version.append(_file_version(daily_path))
+        daily_metrics = pd.read_parquet(daily_path)
+    elif os.path.exists(daily_path.replace('.parquet', '.csv')):
+        data_version.append(_file_version(daily_path.replace('.parquet', '.csv')))
+        daily_metrics = pd.read_csv(daily_path.replace('.parquet', '.csv'),
+                                    dtype=config.DAILY_DTYPES, parse_dates=['date'],
+                                    date_format='%Y-%m-%d', engine='c')
     
     if os.path.exists(lab_path):
-        lab_data = pd.read_csv(lab_path)
-        lab_data['date'] = pd.to_datetime(lab_data['date'])
-    
-    return daily_metrics, lab_data
+        data_version.append(_file_version(lab_path))
+        lab_data = pd.read_parquet(lab_path)
+    elif os.path.exists(lab_path.replace('.parquet', '.csv')):
+        data_version.append(_file_version(lab_path.replace('.parquet', '.csv')))
+        lab_data = pd.read_csv(lab_path.replace('.parquet', '.csv'),
+                               parse_dates=['date'], date_format='%Y-%m-%d', engine='c')
+    
+    return daily_metrics, lab_data, tuple(data_version)
+
+
+def _file_version(path: str) -> tuple:
+    """Identify the current contents of a data file by path, mtime and size."""
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
 
+def _event_shapes(rows: int = 1) -> list:
+    """Build dashed vertical lines marking each critical event on subplot rows 1..rows."""
+    shapes = []
+    for row in range(1, rows + 1):
+        axis = str(row) if row > 1 else ''
+        for event in config.CRITICAL_EVENTS:
+            shapes.append(dict(
+                type='line',
+                xref=f'x{axis}', yref=f'y{axis} domain',
+                x0=event['date_dt'], x1=event['date_dt'], y0=0, y1=1,
+                line=dict(color='red', width=2, dash='dash')
+            ))
+    return shapes
 
+
+def _event_labels(xanchor: str, yanchor: str) -> list:
+    """Build event name labels at the top of the event lines."""
+    return [
+        dict(
+            xref='x', yref='y domain',
+            x=event['date_dt'], y=1,
+            text=event['name'], showarrow=False,
+            xanchor=xanchor, yanchor=yanchor
+        )
+        for event in config.CRITICAL_EVENTS
+    ]
+
+
+# Figures are cached per DataFrame object and data_version. The figure entries
+# can outlive load_data's, so a reloaded frame may reuse a freed id; the
+# version from load_data tells them apart. Figures must be treated as read-only.
+@st.cache_resource(ttl=3600, show_spinner=False, hash_funcs={pd.DataFrame: id})
 def create_timeline_chart(daily_metrics: pd.DataFrame, metric_name: str, 
-                          metric_column: str, color: str = 'blue'):
+                          metric_column: str, color: str = 'blue', *, data_version: tuple):
     """Create a timeline chart for a specific metric with event markers."""
     fig = go.Figure()
     
@@ -66,29 +127,22 @@ def create_timeline_chart(daily_metrics: pd.DataFrame, metric_name: str,
         marker=dict(size=6)
     ))
     
-    # Add event markers
-    for event in config.CRITICAL_EVENTS:
-        event_date = datetime.strptime(event['date'], '%Y-%m-%d')
-        
-        fig.add_vline(
-            x=event_date,
-            line=dict(color='red', width=2, dash='dash'),
-            annotation_text=event['name'],
-            annotation_position='top'
-        )
-    
     fig.update_layout(
         title=metric_name,
         xaxis_title='Date',
         yaxis_title=metric_name,
         hovermode='x unified',
-        height=400
+        height=400,
+        # Event markers, labelled above the line
+        shapes=_event_shapes(),
+        annotations=_event_labels('center', 'bottom')
     )
     
     return fig
 
 
-def create_correlation_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame):
+@st.cache_resource(ttl=3600, show_spinner=False, hash_funcs={pd.DataFrame: id})
+def create_correlation_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame, *, data_version: tuple):
     """Create a multi-axis chart showing correlations between Whoop and lab data."""
     fig = make_subplots(
         rows=3, cols=1,
@@ -134,31 +188,25 @@ def create_correlation_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame
         row=3, col=1
     )
     
-    # Add event markers
-    for event in config.CRITICAL_EVENTS:
-        event_date = datetime.strptime(event['date'], '%Y-%m-%d')
-        for i in range(1, 4):
-            fig.add_vline(
-                x=event_date,
-                line=dict(color='red', width=2, dash='dash'),
-                row=i, col=1
-            )
-    
-    fig.update_layout(height=900, hovermode='x unified', showlegend=True)
+    # Event markers on all three rows
+    fig.update_layout(height=900, hovermode='x unified', showlegend=True,
+                      shapes=_event_shapes(rows=3))
     fig.update_xaxes(title_text='Date', row=3, col=1)
     
     return fig
 
 
-def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame):
+@st.cache_resource(ttl=3600, show_spinner=False, hash_funcs={pd.DataFrame: id})
+def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame, *, data_version: tuple):
     """Create charts comparing lab values with Whoop metrics."""
     if lab_data is None or lab_data.empty:
         return None
     
-    # Get unique test names
-    test_names = lab_data['test_name'].unique()
+    # Split lab results by test name in a single pass
+    groups = dict(tuple(lab_data.groupby('test_name', sort=False)))
     
     charts = {}
+    colors = ['blue', 'green', 'purple']
     
     # For key biomarkers, create comparison charts
     key_biomarkers = {
@@ -168,8 +216,8 @@ def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFr
     }
     
     for biomarker, whoop_metrics in key_biomarkers.items():
-        if biomarker in test_names:
-            biomarker_data = lab_data[lab_data['test_name'] == biomarker]
+        if biomarker in groups:
+            biomarker_data = groups[biomarker]
             
             fig = make_subplots(specs=[[{"secondary_y": True}]])
             
@@ -188,7 +236,6 @@ def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFr
             # Add Whoop metrics
             for i, metric in enumerate(whoop_metrics):
                 if metric in daily_metrics.columns:
-                    colors = ['blue', 'green', 'purple']
                     fig.add_trace(
                         go.Scatter(
                             x=daily_metrics['date'],
@@ -199,19 +246,13 @@ def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFr
                         secondary_y=True
                     )
             
-            # Add event markers
-            for event in config.CRITICAL_EVENTS:
-                event_date = datetime.strptime(event['date'], '%Y-%m-%d')
-                fig.add_vline(
-                    x=event_date,
-                    line=dict(color='red', width=2, dash='dash'),
-                    annotation_text=event['name']
-                )
-            
             fig.update_layout(
                 title=f'{biomarker} Lab Results vs Whoop Metrics',
                 hovermode='x unified',
-                height=400
+                height=400,
+                # Event markers, labelled to the right of the line
+                shapes=_event_shapes(),
+                annotations=_event_labels('left', 'top')
             )
             fig.update_yaxes(title_text=f"{biomarker} (Lab)", secondary_y=False)
             fig.update_yaxes(title_text="Whoop Metrics", secondary_y=True)
@@ -221,14 +262,17 @@ def create_lab_comparison_chart(daily_metrics: pd.DataFrame, lab_data: pd.DataFr
     return charts
 
 
-# Sidebar
-st.sidebar.title("Navigation")
-page = st.sidebar.radio("Select View", ["Overview", "Detailed Metrics", "Lab Correlations", "Data Management"])
+def clear_data_caches():
+    """Drop cached frames and the figures built from them after new data is saved."""
+    load_data.clear()
+    create_timeline_chart.clear()
+    create_correlation_chart.clear()
+    create_lab_comparison_chart.clear()
 
-# Load data
-daily_metrics, lab_data = load_data()
 
-if page == "Overview":
+@st.fragment
+def _overview_page(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame):
+    """Render the overview page."""
     st.header("Overview")
     
     # Show critical events
@@ -257,7 +301,10 @@ if page == "Overview":
         else:
             st.warning("⚠️ No lab data available. Please parse PDFs first.")
 
-elif page == "Detailed Metrics":
+
+@st.fragment
+def _detailed_metrics_page(daily_metrics: pd.DataFrame, data_version: tuple):
+    """Render timeline charts for individual Whoop metrics."""
     st.header("Detailed Whoop Metrics")
     
     if daily_metrics is not None:
@@ -267,12 +314,12 @@ elif page == "Detailed Metrics":
         
         with col1:
             if 'recovery_score' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'Recovery Score', 'recovery_score', 'green')
+                fig = create_timeline_chart(daily_metrics, 'Recovery Score', 'recovery_score', 'green', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             if 'hrv_rmssd' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'HRV (RMSSD)', 'hrv_rmssd', 'lightgreen')
+                fig = create_timeline_chart(daily_metrics, 'HRV (RMSSD)', 'hrv_rmssd', 'lightgreen', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
         
         # Sleep metrics
@@ -281,12 +328,12 @@ elif page == "Detailed Metrics":
         
         with col1:
             if 'sleep_performance' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'Sleep Performance', 'sleep_performance', 'purple')
+                fig = create_timeline_chart(daily_metrics, 'Sleep Performance', 'sleep_performance', 'purple', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             if 'deep_sleep_hours' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'Deep Sleep (hours)', 'deep_sleep_hours', 'indigo')
+                fig = create_timeline_chart(daily_metrics, 'Deep Sleep (hours)', 'deep_sleep_hours', 'indigo', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
         
         # Cardiovascular metrics
@@ -295,28 +342,31 @@ elif page == "Detailed Metrics":
         
         with col1:
             if 'resting_hr' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'Resting Heart Rate', 'resting_hr', 'red')
+                fig = create_timeline_chart(daily_metrics, 'Resting Heart Rate', 'resting_hr', 'red', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             if 'day_strain' in daily_metrics.columns:
-                fig = create_timeline_chart(daily_metrics, 'Day Strain', 'day_strain', 'orange')
+                fig = create_timeline_chart(daily_metrics, 'Day Strain', 'day_strain', 'orange', data_version=data_version)
                 st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("No data available. Please fetch Whoop data first.")
 
-elif page == "Lab Correlations":
+
+@st.fragment
+def _lab_correlations_page(daily_metrics: pd.DataFrame, lab_data: pd.DataFrame, data_version: tuple):
+    """Render Whoop vs lab result comparisons."""
     st.header("Lab Test Correlations")
     
     if daily_metrics is not None and lab_data is not None:
         # Multi-metric correlation chart
         st.subheader("Whoop Metrics Timeline")
-        fig = create_correlation_chart(daily_metrics, lab_data)
+        fig = create_correlation_chart(daily_metrics, lab_data, data_version=data_version)
         st.plotly_chart(fig, use_container_width=True)
         
         # Lab comparison charts
         st.subheader("Lab Results vs Whoop Metrics")
-        charts = create_lab_comparison_chart(daily_metrics, lab_data)
+        charts = create_lab_comparison_chart(daily_metrics, lab_data, data_version=data_version)
         
         if charts:
             for biomarker, fig in charts.items():
@@ -330,11 +380,14 @@ elif page == "Lab Correlations":
     else:
         st.warning("Both Whoop and Lab data are required for correlation analysis.")
 
-elif page == "Data Management":
+
+@st.fragment
+def _data_management_page():
+    """Render authentication, data fetching and PDF parsing controls."""
     st.header("Data Management")
     
     # Show authentication status
-    auth = WhoopAuth()
+    auth = get_auth()
     
     if is_authenticated:
         st.success("✓ Authenticated with Whoop")
@@ -349,36 +402,37 @@ elif page == "Data Management":
     
     # Whoop data fetching
     st.subheader("Fetch Whoop Data")
-        
-        if st.button("Fetch Whoop Data"):
-            with st.spinner("Fetching data from Whoop API..."):
-                try:
-                    client = WhoopClient(auth)
-                    processor = HealthDataProcessor()
-                    
-                    # Fetch all data
-                    whoop_data = client.get_all_health_data(
-                        config.DATA_START_DATE,
-                        config.DATA_END_DATE
-                    )
-                    
-                    # Process data
-                    recovery_df = processor.process_whoop_recovery(whoop_data['recovery'])
-                    sleep_df = processor.process_whoop_sleep(whoop_data['sleep'])
-                    cycles_df = processor.process_whoop_cycles(whoop_data['cycles'])
-                    
-                    # Combine into daily metrics
-                    daily_df = processor.combine_daily_metrics(recovery_df, sleep_df, cycles_df)
-                    
-                    # Save
-                    processor.save_dataframe(daily_df, 'daily_metrics.csv')
-                    processor.save_data(whoop_data, 'whoop_raw_data.json')
-                    
-                    st.success("✓ Data fetched and saved successfully!")
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error fetching data: {e}")
     
+    if st.button("Fetch Whoop Data"):
+        with st.spinner("Fetching data from Whoop API..."):
+            try:
+                client = WhoopClient(auth)
+                processor = HealthDataProcessor()
+                
+                # Fetch all data
+                whoop_data = client.get_all_health_data(
+                    config.DATA_START_DATE,
+                    config.DATA_END_DATE
+                )
+                
+                # Process data
+                recovery_df = processor.process_whoop_recovery(whoop_data['recovery'])
+                sleep_df = processor.process_whoop_sleep(whoop_data['sleep'])
+                cycles_df = processor.process_whoop_cycles(whoop_data['cycles'])
+                
+                # Combine into daily metrics
+                daily_df = processor.combine_daily_metrics(recovery_df, sleep_df, cycles_df)
+                
+                # Save
+                processor.save_dataframe(daily_df, 'daily_metrics.parquet')
+                processor.save_data(whoop_data, 'whoop_raw_data.json')
+                
+                st.success("✓ Data fetched and saved successfully!")
+                clear_data_caches()
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error fetching data: {e}")
+
     # Lab data parsing
     st.subheader("Parse Lab Test PDFs")
     
@@ -391,10 +445,11 @@ elif page == "Data Management":
                 lab_results = parser.parse_all_pdfs()
                 lab_df = processor.process_lab_data(lab_results)
                 
-                processor.save_dataframe(lab_df, 'lab_data.csv')
+                processor.save_dataframe(lab_df, 'lab_data.parquet')
                 processor.save_data(lab_results, 'lab_raw_data.json')
                 
                 st.success(f"✓ Parsed {len(lab_results)} PDF files successfully!")
+                clear_data_caches()
                 st.rerun()
             except Exception as e:
                 st.error(f"Error parsing PDFs: {e}")
@@ -409,3 +464,22 @@ elif page == "Data Management":
                 st.text(f"📄 {file}")
         else:
             st.info("No data files yet")
+
+
+# Sidebar
+st.sidebar.title("Navigation")
+page = st.sidebar.radio("Select View", ["Overview", "Detailed Metrics", "Lab Correlations", "Data Management"])
+
+# Load data. Pages only read these shared cached frames (the chart caches are
+# keyed on their identity and data_version); copy before mutating.
+daily_metrics, lab_data, data_version = load_data()
+
+# Each page is a fragment, so widget interactions rerun only the active page
+if page == "Overview":
+    _overview_page(daily_metrics, lab_data)
+elif page == "Detailed Metrics":
+    _detailed_metrics_page(daily_metrics, data_version)
+elif page == "Lab Correlations":
+    _lab_correlations_page(daily_metrics, lab_data, data_version)
+elif page == "Data Management":
+    _data_management_page()
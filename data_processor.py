@@ -3,16 +3,102 @@ import json
 import os
 from datetime import datetime, timedelta
 from typing import Dict, List
+import numpy as np
 import pandas as pd
 import config
 
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
 
 class HealthDataProcessor:
     """Process and combine Whoop data with lab test results."""
     
+    # Flattened Whoop API fields (json_normalize paths) -> output column names
+    _RECOVERY_COLUMNS = {
+        'cycle_id': 'cycle_id',
+        'score.recovery_score': 'recovery_score',
+        'score.hrv_rmssd_milli': 'hrv_rmssd',
+        'score.resting_heart_rate': 'resting_hr',
+        'score.spo2_percentage': 'spo2',
+        'score.skin_temp_celsius': 'skin_temp',
+        'score_state': 'score_state',
+        'user_calibrating': 'user_calibrating'
+    }
+    _SLEEP_COLUMNS = {
+        'id': 'sleep_id',
+        'score.sleep_performance_percentage': 'sleep_performance',
+        'score.sleep_efficiency_percentage': 'sleep_efficiency',
+        'score.sleep_consistency_percentage': 'sleep_consistency',
+        'score.stage_summary.total_in_bed_time_milli': 'total_sleep_hours',
+        'score.stage_summary.total_light_sleep_time_milli': 'light_sleep_hours',
+        'score.stage_summary.total_slow_wave_sleep_time_milli': 'deep_sleep_hours',
+        'score.stage_summary.total_rem_sleep_time_milli': 'rem_sleep_hours',
+        'score.stage_summary.total_awake_time_milli': 'awake_hours',
+        'score.respiratory_rate': 'respiratory_rate',
+        'score.disturbance_count': 'disturbance_count',
+        'score.sleep_cycle_count': 'sleep_cycle_count'
+    }
+    _SLEEP_HOUR_COLUMNS = [
+        'total_sleep_hours', 'light_sleep_hours', 'deep_sleep_hours',
+        'rem_sleep_hours', 'awake_hours'
+    ]
+    _CYCLE_COLUMNS = {
+        'id': 'cycle_id',
+        'score.strain': 'day_strain',
+        'score.average_heart_rate': 'avg_hr',
+        'score.max_heart_rate': 'max_hr',
+        'score.kilojoule': 'kilojoules'
+    }
+    _WORKOUT_COLUMNS = {
+        'id': 'workout_id',
+        'sport_name': 'sport',
+        'score.strain': 'workout_strain',
+        'score.average_heart_rate': 'avg_hr',
+        'score.max_heart_rate': 'max_hr',
+        'score.kilojoule': 'kilojoules',
+        'score.distance_meter': 'distance_meters'
+    }
+    
+    # Whoop metrics fit in float32 (scores, bpm, hours); NaN rules out ints
+    _DTYPES = {
+        **config.DAILY_DTYPES,
+        'workout_strain': 'float32',
+        'distance_meters': 'float32'
+    }
+    
     def __init__(self):
         self.output_dir = config.DATA_OUTPUT_DIR
     
+    def _flatten_records(self, records: List[Dict], date_field: str,
+                         columns: Dict[str, str]) -> pd.DataFrame:
+        """
+        Flatten Whoop API records into a DataFrame in one vectorized pass.
+        
+        Args:
+            records: List of records from Whoop API
+            date_field: Timestamp field the record date is taken from
+            columns: Mapping of flattened field paths to output column names
+            
+        Returns:
+            DataFrame with a 'date' column followed by the mapped columns
+        """
+        df = pd.json_normalize(records, sep='.')
+        
+        # Fields missing from every record still get a (NaN) column
+        df = df.reindex(columns=[date_field, *columns])
+        # Calendar day (UTC) as datetime64 at midnight, matching the daily date range
+        timestamps = pd.to_datetime(df[date_field], utc=True, format='ISO8601')
+        df[date_field] = timestamps.dt.tz_localize(None).dt.normalize()
+        
+        return df.rename(columns={date_field: 'date', **columns})
+    
+    def _downcast(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Narrow known numeric columns to the dtypes in _DTYPES."""
+        return df.astype({col: dtype for col, dtype in self._DTYPES.items() if col in df.columns})
+    
     def process_whoop_recovery(self, recovery_data: List[Dict]) -> pd.DataFrame:
         """
         Process Whoop recovery data into a pandas DataFrame.
@@ -26,31 +112,10 @@ class HealthDataProcessor:
         if not recovery_data:
             return pd.DataFrame()
         
-        processed = []
-        for record in recovery_data:
-            score = record.get('score', {})
-            
-            # Extract date from cycle_id or created_at
-            date = None
-            if 'created_at' in record:
-                date = datetime.fromisoformat(record['created_at'].replace('Z', '+00:00')).date()
-            
-            processed.append({
-                'date': date,
-                'cycle_id': record.get('cycle_id'),
-                'recovery_score': score.get('recovery_score'),
-                'hrv_rmssd': score.get('hrv_rmssd_milli'),
-                'resting_hr': score.get('resting_heart_rate'),
-                'spo2': score.get('spo2_percentage'),
-                'skin_temp': score.get('skin_temp_celsius'),
-                'score_state': record.get('score_state'),
-                'user_calibrating': record.get('user_calibrating', False)
-            })
+        df = self._flatten_records(recovery_data, 'created_at', self._RECOVERY_COLUMNS)
+        df['user_calibrating'] = df['user_calibrating'].fillna(False)
         
-        df = pd.DataFrame(processed)
-        if not df.empty and 'date' in df.columns:
-            df = df.sort_values('date')
-        return df
+        return self._downcast(df)
     
     def process_whoop_sleep(self, sleep_data: List[Dict]) -> pd.DataFrame:
         """
@@ -65,39 +130,15 @@ class HealthDataProcessor:
         if not sleep_data:
             return pd.DataFrame()
         
-        processed = []
-        for record in sleep_data:
-            score = record.get('score', {})
-            stage_summary = score.get('stage_summary', {})
-            
-            # Extract date from end time
-            date = None
-            if 'end' in record:
-                date = datetime.fromisoformat(record['end'].replace('Z', '+00:00')).date()
-            
-            # Convert milliseconds to hours
-            ms_to_hours = 1000 * 60 * 60
-            
-            processed.append({
-                'date': date,
-                'sleep_id': record.get('id'),
-                'sleep_performance': score.get('sleep_performance_percentage'),
-                'sleep_efficiency': score.get('sleep_efficiency_percentage'),
-                'sleep_consistency': score.get('sleep_consistency_percentage'),
-                'total_sleep_hours': stage_summary.get('total_in_bed_time_milli', 0) / ms_to_hours,
-                'light_sleep_hours': stage_summary.get('total_light_sleep_time_milli', 0) / ms_to_hours,
-                'deep_sleep_hours': stage_summary.get('total_slow_wave_sleep_time_milli', 0) / ms_to_hours,
-                'rem_sleep_hours': stage_summary.get('total_rem_sleep_time_milli', 0) / ms_to_hours,
-                'awake_hours': stage_summary.get('total_awake_time_milli', 0) / ms_to_hours,
-                'respiratory_rate': score.get('respiratory_rate'),
-                'disturbance_count': score.get('disturbance_count'),
-                'sleep_cycle_count': score.get('sleep_cycle_count')
-            })
+        # Date is taken from the end time
+        df = self._flatten_records(sleep_data, 'end', self._SLEEP_COLUMNS)
         
-        df = pd.DataFrame(processed)
-        if not df.empty and 'date' in df.columns:
-            df = df.sort_values('date')
-        return df
+        # Convert milliseconds to hours for all stage columns in one float32 multiply
+        ms_to_hours = 1000 * 60 * 60
+        hour_cols = self._SLEEP_HOUR_COLUMNS
+        df[hour_cols] = df[hour_cols].fillna(0).to_numpy(dtype=np.float32) * np.float32(1 / ms_to_hours)
+        
+        return self._downcast(df)
     
     def process_whoop_cycles(self, cycle_data: List[Dict]) -> pd.DataFrame:
         """
@@ -112,28 +153,9 @@ class HealthDataProcessor:
         if not cycle_data:
             return pd.DataFrame()
         
-        processed = []
-        for record in cycle_data:
-            score = record.get('score', {})
-            
-            # Extract date from start time
-            date = None
-            if 'start' in record:
-                date = datetime.fromisoformat(record['start'].replace('Z', '+00:00')).date()
-            
-            processed.append({
-                'date': date,
-                'cycle_id': record.get('id'),
-                'day_strain': score.get('strain'),
-                'avg_hr': score.get('average_heart_rate'),
-                'max_hr': score.get('max_heart_rate'),
-                'kilojoules': score.get('kilojoule')
-            })
+        df = self._flatten_records(cycle_data, 'start', self._CYCLE_COLUMNS)
         
-        df = pd.DataFrame(processed)
-        if not df.empty and 'date' in df.columns:
-            df = df.sort_values('date')
-        return df
+        return self._downcast(df)
     
     def process_whoop_workouts(self, workout_data: List[Dict]) -> pd.DataFrame:
         """
@@ -148,30 +170,9 @@ class HealthDataProcessor:
         if not workout_data:
             return pd.DataFrame()
         
-        processed = []
-        for record in workout_data:
-            score = record.get('score', {})
-            
-            # Extract date from start time
-            date = None
-            if 'start' in record:
-                date = datetime.fromisoformat(record['start'].replace('Z', '+00:00')).date()
-            
-            processed.append({
-                'date': date,
-                'workout_id': record.get('id'),
-                'sport': record.get('sport_name'),
-                'workout_strain': score.get('strain'),
-                'avg_hr': score.get('average_heart_rate'),
-                'max_hr': score.get('max_heart_rate'),
-                'kilojoules': score.get('kilojoule'),
-                'distance_meters': score.get('distance_meter')
-            })
+        df = self._flatten_records(workout_data, 'start', self._WORKOUT_COLUMNS)
         
-        df = pd.DataFrame(processed)
-        if not df.empty and 'date' in df.columns:
-            df = df.sort_values('date')
-        return df
+        return self._downcast(df)
     
     def process_lab_data(self, lab_results: List[Dict]) -> pd.DataFrame:
         """
@@ -203,7 +204,7 @@ class HealthDataProcessor:
         
         df = pd.DataFrame(all_tests)
         if not df.empty and 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date']).dt.date
+            df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
             df = df.sort_values('date')
         return df
     
@@ -225,25 +226,29 @@ class HealthDataProcessor:
         end = datetime.strptime(config.DATA_END_DATE, '%Y-%m-%d').date()
         
         date_range = pd.date_range(start=start, end=end, freq='D')
-        daily_df = pd.DataFrame({'date': [d.date() for d in date_range]})
-        
-        # Merge recovery data
-        if not recovery_df.empty:
-            daily_df = daily_df.merge(recovery_df, on='date', how='left')
+        daily_df = pd.DataFrame(index=date_range.rename('date'))
         
-        # Merge sleep data
-        if not sleep_df.empty:
-            daily_df = daily_df.merge(sleep_df, on='date', how='left', suffixes=('', '_sleep'))
+        # Index each source by date, suffixing column names that are already taken
+        frames = []
+        seen_columns = set()
+        for df, suffix in ((recovery_df, ''), (sleep_df, '_sleep'), (cycles_df, '_cycle')):
+            if df.empty:
+                continue
+            df = df.set_index('date')
+            df = df.rename(columns={col: f'{col}{suffix}' for col in df.columns if col in seen_columns})
+            seen_columns.update(df.columns)
+            frames.append(df)
         
-        # Merge cycle data
-        if not cycles_df.empty:
-            daily_df = daily_df.merge(cycles_df, on='date', how='left', suffixes=('', '_cycle'))
+        # Align everything on the date range in one pass (pandas concatenates and
+        # reindexes when dates are unique, and falls back to merging otherwise);
+        # the result follows the sorted date range, so sources need no sorting
+        if frames:
+            daily_df = daily_df.join(frames, how='left')
+        daily_df = daily_df.reset_index()
         
         # Add event markers
-        daily_df['event'] = ''
-        for event in config.CRITICAL_EVENTS:
-            event_date = datetime.strptime(event['date'], '%Y-%m-%d').date()
-            daily_df.loc[daily_df['date'] == event_date, 'event'] = event['name']
+        event_map = {event['date_dt']: event['name'] for event in config.CRITICAL_EVENTS}
+        daily_df['event'] = daily_df['date'].map(event_map).fillna('')
         
         return daily_df
     
@@ -255,21 +260,35 @@ class HealthDataProcessor:
             data: Data to save
             filename: Output filename
         """
+        config.ensure_directories()
         output_path = os.path.join(self.output_dir, filename)
         
-        with open(output_path, 'w') as f:
-            json.dump(data, f, indent=2, default=str)
+        if orjson is not None:
+            options = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            with open(output_path, 'wb') as f:
+                f.write(orjson.dumps(data, option=options, default=str))
+        else:
+            with open(output_path, 'w') as f:
+                json.dump(data, f, indent=2, default=str)
         
         print(f"✓ Saved data to {output_path}")
     
     def save_dataframe(self, df: pd.DataFrame, filename: str):
         """
-        Save DataFrame to CSV file.
+        Save DataFrame to Parquet or CSV file, based on the filename extension.
+        
+        Parquet keeps column dtypes (including datetimes), so reloading it
+        needs no text parsing.
         
         Args:
             df: DataFrame to save
-            filename: Output filename
+            filename: Output filename (.parquet or .csv)
         """
+        config.ensure_directories()
         output_path = os.path.join(self.output_dir, filename)
-        df.to_csv(output_path, index=False)
+        if filename.endswith('.parquet'):
+            df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
+        else:
+            # Dates are whole days, so a fixed format avoids per-row formatting inference
+            df.to_csv(output_path, index=False, chunksize=50_000, date_format='%Y-%m-%d')
         print(f"✓ Saved DataFrame to {output_path}")
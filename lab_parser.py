@@ -1,17 +1,72 @@
 """PDF parser for lab test results."""
+import hashlib
+import json
+import logging
+import mmap
+import multiprocessing
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import List, Dict, Optional
+from itertools import repeat
+from typing import List, Dict, Iterator, Optional, Tuple
 import PyPDF2
 import config
 
+try:
+    import pymupdf as fitz  # PyMuPDF, much faster text extraction
+except ImportError:  # Fall back to PyPDF2
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+# Standalone numeric value, optionally comma-grouped ("1,200"), and the token after it
+# as its unit, e.g. "95 mg/dL", "41 mL/min/1.73", "118 K/cu mm"
+_VALUE_RE = re.compile(r'(?<!\S)(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?)(?!\S)(?:\s+(\S+))?')
+
+# Cheap pre-filter for lines that cannot hold a value
+_HAS_DIGIT = re.compile(r'\d').search
+
+# Date in filenames: "Feb 16, 2026.pdf" or similar
+_DATE_RE = re.compile(r'([A-Za-z]+)\s+(\d+),?\s+(\d{4})')
+
+# Abbreviated and full English month names, as accepted by strptime's %b and %B
+_MONTH_NAMES = ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+                'august', 'september', 'october', 'november', 'december')
+_MONTHS = {name[:length]: number for number, name in enumerate(_MONTH_NAMES, 1) for length in (3, None)}
+
+# Common test names to look for
+_TEST_NAMES = (
+    'Glucose', 'Sodium', 'Potassium', 'Chloride', 'CO2', 'BUN', 'Creatinine',
+    'Calcium', 'WBC', 'RBC', 'Hemoglobin', 'Hematocrit', 'MCV', 'MCH', 'MCHC',
+    'RDW', 'Platelet', 'Neutrophils', 'Lymphocytes', 'Monocytes', 'Eosinophils',
+    'Basophils', 'eGFR'
+)
+
+# Single case-insensitive matcher for all test names (plurals too, e.g. "Platelets"),
+# mapped back to the canonical spelling. Only the end of a name is anchored: extraction
+# can glue a name onto the preceding unit, as in "11.2 g/dLHEMOGLOBIN"
+_TEST_RE = re.compile(r'(' + '|'.join(map(re.escape, _TEST_NAMES)) + r')s?\b', re.IGNORECASE)
+_TEST_NAME_LOOKUP = {name.lower(): name for name in _TEST_NAMES}
+
+# Filename keywords -> test type, checked in order
+_TEST_TYPES = (
+    ('BASIC METABOLIC', 'Basic Metabolic Panel'),
+    ('CBC', 'Complete Blood Count'),
+    ('GLUCOSE', 'Glucose')
+)
+
+# Bump when parsing output changes so cached results from older versions are ignored
+_CACHE_VERSION = 4
+
 
 class LabDataParser:
     """Parser for extracting lab test results from PDF files."""
     
     def __init__(self, health_data_dir: str = None):
         self.health_data_dir = health_data_dir or config.HEALTH_DATA_DIR
+        self.cache_file = os.path.join(self.health_data_dir, '.lab_cache.json')
     
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
@@ -23,12 +78,40 @@ class LabDataParser:
         Returns:
             Extracted text content
         """
-        text = ""
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
+        if fitz is not None:
+            with fitz.open(pdf_path) as doc:
+                # Pages without fonts are scanned images with no text to extract.
+                # sort=True keeps each table row on one line, as parse_lab_values expects
+                return "".join(page.get_text("text", sort=True) for page in doc if page.get_fonts())
+        
+        # Memory-map the file so PyPDF2 seeks and reads straight from the OS page cache
+        parts = []
+        with open(pdf_path, 'rb') as file, \
+                mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pdf_reader = PyPDF2.PdfReader(mapped)
             for page in pdf_reader.pages:
-                text += page.extract_text()
-        return text
+                if self._is_image_only_page(page):
+                    continue
+                parts.append(page.extract_text())
+        return "".join(parts)
+    
+    def _is_image_only_page(self, page: PyPDF2.PageObject) -> bool:
+        """
+        Check whether a PyPDF2 page is a scanned image with no text layer.
+        
+        Args:
+            page: PDF page
+            
+        Returns:
+            True if the page uses no fonts and draws only image XObjects
+        """
+        resources = page['/Resources'] if '/Resources' in page else {}
+        if '/Font' in resources:
+            return False
+        
+        xobjects = resources['/XObject'] if '/XObject' in resources else {}
+        # Text can also live inside form XObjects, so only skip pure image pages
+        return all(xobjects[name].get('/Subtype') == '/Image' for name in xobjects)
     
     def parse_date_from_filename(self, filename: str) -> Optional[str]:
         """
@@ -40,19 +123,16 @@ class LabDataParser:
         Returns:
             Date in YYYY-MM-DD format or None
         """
-        # Pattern: "Feb 16, 2026.pdf" or similar
-        date_pattern = r'([A-Za-z]+)\s+(\d+),?\s+(\d{4})'
-        match = re.search(date_pattern, filename)
+        match = _DATE_RE.search(filename)
         
         if match:
             month_str, day, year = match.groups()
-            try:
-                date_obj = datetime.strptime(f"{month_str} {day} {year}", "%b %d %Y")
-                return date_obj.strftime("%Y-%m-%d")
-            except ValueError:
+            month = _MONTHS.get(month_str.lower())
+            if month is not None:
                 try:
-                    date_obj = datetime.strptime(f"{month_str} {day} {year}", "%B %d %Y")
-                    return date_obj.strftime("%Y-%m-%d")
+                    # Constructing the date rejects days the month doesn't have
+                    date_obj = datetime(int(year), month, int(day))
+                    return f"{date_obj.year:04d}-{date_obj.month:02d}-{date_obj.day:02d}"
                 except ValueError:
                     pass
         
@@ -77,53 +157,38 @@ class LabDataParser:
         
         lines = text.split('\n')
         
-        for i, line in enumerate(lines):
-            line = line.strip()
-            if not line:
+        for line in lines:
+            # Every result carries a numeric value, so skip lines without digits
+            if not _HAS_DIGIT(line):
                 continue
+            line = line.strip()
             
             # Try to identify test name and value patterns
             # This is a simplified parser - may need adjustment based on actual PDF format
+            test_match = _TEST_RE.search(line)
+            if not test_match:
+                continue
             
-            # Pattern for numeric values with units
-            value_pattern = r'(\d+\.?\d*)\s*(mg/dL|mmol/L|g/dL|%|K/uL|M/uL|fL|pg|g/dL|mEq/L|/'
+            # Prefer the value to the right of the test name; some table layouts
+            # put the values first, so fall back to the start of the line
+            value_match = _VALUE_RE.search(line, test_match.end()) or _VALUE_RE.search(line)
+            if not value_match:
+                continue
             
-            # Look for common test names
-            test_names = [
-                'Glucose', 'Sodium', 'Potassium', 'Chloride', 'CO2', 'BUN', 'Creatinine',
-                'Calcium', 'WBC', 'RBC', 'Hemoglobin', 'Hematocrit', 'MCV', 'MCH', 'MCHC',
-                'RDW', 'Platelet', 'Neutrophils', 'Lymphocytes', 'Monocytes', 'Eosinophils',
-                'Basophils', 'eGFR'
-            ]
+            # Try to find reference range right after the value
+            ref_range = ''
+            for part in line[value_match.end():].split(None, 4)[:4]:
+                if '-' in part or 'to' in part.lower():
+                    ref_range = part
+                    break
             
-            for test_name in test_names:
-                if test_name.lower() in line.lower():
-                    # Try to extract value and reference range
-                    parts = line.split()
-                    
-                    # Simple heuristic: look for numeric value after test name
-                    for j, part in enumerate(parts):
-                        try:
-                            value = float(part.replace(',', ''))
-                            unit = parts[j + 1] if j + 1 < len(parts) else ''
-                            
-                            # Try to find reference range
-                            ref_range = ''
-                            for k in range(j + 1, min(j + 5, len(parts))):
-                                if '-' in parts[k] or 'to' in parts[k].lower():
-                                    ref_range = parts[k]
-                                    break
-                            
-                            results.append({
-                                'test_name': test_name,
-                                'value': value,
-                                'unit': unit,
-                                'reference_range': ref_range,
-                                'test_type': test_type
-                            })
-                            break
-                        except (ValueError, IndexError):
-                            continue
+            results.append({
+                'test_name': _TEST_NAME_LOOKUP[test_match.group(1).lower()],
+                'value': float(value_match.group(1).replace(',', '')),
+                'unit': value_match.group(2) or '',
+                'reference_range': ref_range,
+                'test_type': test_type
+            })
         
         return results
     
@@ -140,13 +205,8 @@ class LabDataParser:
         filename = os.path.basename(pdf_path)
         
         # Extract test type from filename
-        test_type = "Unknown"
-        if "BASIC METABOLIC" in filename.upper():
-            test_type = "Basic Metabolic Panel"
-        elif "CBC" in filename.upper():
-            test_type = "Complete Blood Count"
-        elif "GLUCOSE" in filename.upper():
-            test_type = "Glucose"
+        upper_name = filename.upper()
+        test_type = next((name for keyword, name in _TEST_TYPES if keyword in upper_name), "Unknown")
         
         # Extract date
         test_date = self.parse_date_from_filename(filename)
@@ -163,36 +223,130 @@ class LabDataParser:
             'raw_text': text[:500]  # Store first 500 chars for debugging
         }
     
+    def _cache_key(self, pdf_path: str, stat: Optional[os.stat_result] = None) -> str:
+        """
+        Build a cache key that changes whenever the file or the text extractor changes.
+        
+        Args:
+            pdf_path: Path to PDF file
+            stat: Stat result for pdf_path, if already known
+            
+        Returns:
+            Hex digest of the parser version, extractor, path, mtime and size
+        """
+        if stat is None:
+            stat = os.stat(pdf_path)
+        # PyMuPDF and PyPDF2 lay text out differently, so their results aren't interchangeable
+        extractor = 'fitz' if fitz else 'pypdf2'
+        key = f"{_CACHE_VERSION}|{extractor}|{pdf_path}|{stat.st_mtime_ns}|{stat.st_size}"
+        return hashlib.blake2b(key.encode()).hexdigest()
+    
+    def _load_cache(self) -> Dict:
+        """Load previously parsed results, keyed by _cache_key."""
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_cache(self, cache: Dict):
+        """Save parsed results for reuse by later runs."""
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump(cache, f)
+        except OSError as e:
+            logger.warning(f"Could not write lab cache '{self.cache_file}': {e}")
+    
     def parse_all_pdfs(self) -> List[Dict]:
         """
         Parse all PDF files in the health data directory.
         
+        Files unchanged since the last run are served from the on-disk cache.
+        
         Returns:
             List of parsed lab result dictionaries
         """
         all_results = []
         
         if not os.path.exists(self.health_data_dir):
-            print(f"Warning: Health data directory '{self.health_data_dir}' not found")
+            logger.warning(f"Health data directory '{self.health_data_dir}' not found")
             return all_results
         
-        pdf_files = [f for f in os.listdir(self.health_data_dir) if f.endswith('.pdf')]
+        with os.scandir(self.health_data_dir) as it:
+            entries = [e for e in it if e.name.endswith('.pdf') and e.is_file()]
+        
+        logger.info(f"Found {len(entries)} PDF files in {self.health_data_dir}")
+        if not entries:
+            return all_results
         
-        print(f"Found {len(pdf_files)} PDF files in {self.health_data_dir}")
+        pdf_paths = [e.path for e in entries]
+        keys = {e.path: self._cache_key(e.path, e.stat()) for e in entries}
         
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(self.health_data_dir, pdf_file)
-            print(f"Parsing {pdf_file}...")
+        cache = self._load_cache()
+        parsed = {}
+        for pdf_path, key in keys.items():
+            if key in cache:
+                parsed[pdf_path] = cache[key]
+                logger.info(f"✓ Loaded {len(cache[key]['results'])} cached values for {os.path.basename(pdf_path)}")
+        
+        # Files are independent and parsing is CPU-bound, so fan out across processes
+        to_parse = [pdf_path for pdf_path in pdf_paths if pdf_path not in parsed]
+        if to_parse:
+            max_workers = min(len(to_parse), os.cpu_count() or 1)
+            if max_workers == 1:
+                # Starting a worker process costs more than it saves for one file or CPU
+                outcomes = zip(to_parse, map(_parse_pdf_task, repeat(self), to_parse))
+            else:
+                outcomes = self._parse_in_processes(to_parse, max_workers)
             
-            try:
-                result = self.parse_pdf_file(pdf_path)
-                all_results.append(result)
-                print(f"✓ Extracted {len(result['results'])} values from {pdf_file}")
-            except Exception as e:
-                print(f"✗ Error parsing {pdf_file}: {e}")
+            for pdf_path, (pdf_file, result, error) in outcomes:
+                if error is None:
+                    parsed[pdf_path] = result
+                    logger.info(f"✓ Extracted {len(result['results'])} values from {pdf_file}")
+                else:
+                    logger.error(f"✗ Error parsing {pdf_file}: {error}")
+            
+            # Rewrite the cache with current files only, dropping stale entries
+            self._save_cache({keys[pdf_path]: result for pdf_path, result in parsed.items()})
         
+        all_results = [parsed[pdf_path] for pdf_path in pdf_paths if pdf_path in parsed]
         return all_results
     
+    def _parse_in_processes(self, pdf_paths: List[str],
+                            max_workers: int) -> Iterator[Tuple[str, Tuple[str, Optional[Dict], Optional[str]]]]:
+        """
+        Parse PDFs in a pool of worker processes.
+        
+        If a worker dies (native crash, OOM kill, or a calling script without
+        an ``if __name__ == '__main__'`` guard), the files it left unfinished
+        are reported as errors and files already parsed are still returned.
+        
+        Args:
+            pdf_paths: Paths to PDF files
+            max_workers: Number of worker processes
+            
+        Returns:
+            Iterator of (pdf_path, _parse_pdf_task outcome), in pdf_paths order
+        """
+        # Spawn rather than fork: forking the multithreaded Streamlit server can deadlock the workers
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = {}
+            try:
+                for pdf_path in pdf_paths:
+                    futures[pdf_path] = executor.submit(_parse_pdf_task, self, pdf_path)
+            except BrokenProcessPool:
+                pass  # Unsubmitted files are reported below
+            
+            for pdf_path in pdf_paths:
+                try:
+                    if pdf_path not in futures:
+                        raise BrokenProcessPool("worker pool stopped before the file was submitted")
+                    outcome = futures[pdf_path].result()
+                except BrokenProcessPool as e:
+                    outcome = (os.path.basename(pdf_path), None, f"worker process failed: {e}")
+                yield pdf_path, outcome
+    
     def manual_entry_helper(self, pdf_path: str):
         """
         Helper function to display PDF text for manual data entry.
@@ -209,6 +363,24 @@ class LabDataParser:
         print("=" * 80)
 
 
+def _parse_pdf_task(parser: LabDataParser, pdf_path: str) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """
+    Parse one PDF in a worker process, reporting errors instead of raising.
+    
+    Args:
+        parser: Parser instance (pickled into the worker)
+        pdf_path: Path to PDF file
+        
+    Returns:
+        Tuple of (filename, parsed result or None, error message or None)
+    """
+    pdf_file = os.path.basename(pdf_path)
+    try:
+        return pdf_file, parser.parse_pdf_file(pdf_path), None
+    except Exception as e:
+        return pdf_file, None, str(e)
+
+
 def create_manual_lab_data_template() -> Dict:
     """
     Create a template for manually entering lab data.
@@ -4,9 +4,28 @@ from whoop_auth import WhoopAuth
 import config
 
 
+@st.cache_resource
+def _shared_auth() -> WhoopAuth:
+    """Create the WhoopAuth instance shared across reruns."""
+    return WhoopAuth()
+
+
+def get_auth() -> WhoopAuth:
+    """
+    Return the shared WhoopAuth instance with its tokens synced from disk.
+    
+    Another process (e.g. auth_server.py's callback or a refresh there) may
+    have rewritten the token file; re-reading it only costs a stat while the
+    file is unchanged.
+    """
+    auth = _shared_auth()
+    auth.tokens = auth._load_tokens()
+    return auth
+
+
 def handle_oauth_flow():
     """Handle OAuth flow within Streamlit using query parameters."""
-    auth = WhoopAuth()
+    auth = get_auth()
     
     # Check for OAuth callback
     query_params = st.query_params
@@ -37,7 +56,7 @@ def handle_oauth_flow():
 
 def show_login_button():
     """Display login button that redirects to Whoop OAuth."""
-    auth = WhoopAuth()
+    auth = get_auth()
     auth_url, state = auth.generate_auth_url()
     
     # Store state in session
@@ -63,7 +82,7 @@ def show_login_button():
 def show_logout_button():
     """Display logout button."""
     if st.button("🚪 Logout"):
-        auth = WhoopAuth()
+        auth = get_auth()
         auth.revoke_access()
         st.session_state.clear()
         st.rerun()
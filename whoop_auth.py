@@ -3,10 +3,22 @@ import os
 import json
 import secrets
 import requests
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 import config
 
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib parser
+    orjson = None
+
+# Shared HTTP session so token and revoke calls reuse pooled connections
+_session = requests.Session()
+
+# Parsed token files keyed by path, as (st_mtime_ns, tokens)
+_tokens_cache = {}
+
 
 class WhoopAuth:
     """Handles Whoop OAuth 2.0 authentication and token management."""
@@ -19,16 +31,32 @@ class WhoopAuth:
         self.tokens = self._load_tokens()
     
     def _load_tokens(self) -> Dict:
-        """Load tokens from file if they exist."""
-        if os.path.exists(self.token_file):
-            with open(self.token_file, 'r') as f:
-                return json.load(f)
-        return {}
+        """Load tokens from file if they exist, reusing the last parse while the file is unchanged."""
+        try:
+            mtime = os.stat(self.token_file).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        
+        cached = _tokens_cache.get(self.token_file)
+        if cached is None or cached[0] != mtime:
+            if orjson is not None:
+                with open(self.token_file, 'rb') as f:
+                    cached = (mtime, orjson.loads(f.read()))
+            else:
+                with open(self.token_file, 'r') as f:
+                    cached = (mtime, json.load(f))
+            _tokens_cache[self.token_file] = cached
+        return dict(cached[1])
     
     def _save_tokens(self):
         """Save tokens to file."""
-        with open(self.token_file, 'w') as f:
-            json.dump(self.tokens, f, indent=2)
+        config.ensure_directories()
+        if orjson is not None:
+            with open(self.token_file, 'wb') as f:
+                f.write(orjson.dumps(self.tokens, option=orjson.OPT_INDENT_2))
+        else:
+            with open(self.token_file, 'w') as f:
+                json.dump(self.tokens, f, indent=2)
     
     def generate_auth_url(self) -> tuple[str, str]:
         """
@@ -48,7 +76,7 @@ class WhoopAuth:
             'state': state
         }
         
-        auth_url = f"{config.WHOOP_AUTH_URL}?{'&'.join(f'{k}={v}' for k, v in params.items())}"
+        auth_url = f"{config.WHOOP_AUTH_URL}?{urlencode(params)}"
         return auth_url, state
     
     def exchange_code_for_token(self, code: str) -> Dict:
@@ -69,7 +97,7 @@ class WhoopAuth:
             'redirect_uri': self.redirect_uri
         }
         
-        response = requests.post(config.WHOOP_TOKEN_URL, data=data)
+        response = _session.post(config.WHOOP_TOKEN_URL, data=data)
         response.raise_for_status()
         
         token_data = response.json()
@@ -105,7 +133,7 @@ class WhoopAuth:
             'client_secret': self.client_secret
         }
         
-        response = requests.post(config.WHOOP_TOKEN_URL, data=data)
+        response = _session.post(config.WHOOP_TOKEN_URL, data=data)
         response.raise_for_status()
         
         token_data = response.json()
@@ -153,7 +181,7 @@ class WhoopAuth:
                 headers = {
                     'Authorization': f"Bearer {self.tokens['access_token']}"
                 }
-                requests.delete(
+                _session.delete(
                     f"{config.WHOOP_API_BASE_URL}/v2/user/access",
                     headers=headers
                 )
@@ -1,43 +1,123 @@
 """Whoop API client for fetching health data."""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from whoop_auth import WhoopAuth
 import config
 
+try:
+    import httpx
+except ImportError:  # Only needed for get_all_health_data_async
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+def create_session() -> requests.Session:
+    """
+    Create an HTTP session that keeps connections to the Whoop API alive.
+    
+    Rate-limited (429) and transient server errors are retried with backoff;
+    the final response is returned so callers still see the HTTP error.
+    """
+    retries = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False
+    )
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries))
+    return session
+
 
 class WhoopClient:
     """Client for interacting with Whoop API endpoints."""
     
-    def __init__(self, auth: WhoopAuth):
+    def __init__(self, auth: WhoopAuth, session: Optional[requests.Session] = None):
         self.auth = auth
         self.base_url = config.WHOOP_API_BASE_URL
+        self.session = session or create_session()
+        self._access_token = None
+        self._token_check_at = 0.0
+        self._token_lock = threading.Lock()
         self.rate_limit_remaining = None
         self.rate_limit_reset = None
+        self._profile = None
+        self._profile_etag = None
     
-    def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+    def _get(self, endpoint: str, params: Optional[Dict] = None,
+             headers: Optional[Dict] = None) -> requests.Response:
         """
-        Make authenticated request to Whoop API.
+        Send authenticated GET request to Whoop API.
         
         Args:
             endpoint: API endpoint path
             params: Query parameters
+            headers: Extra request headers
             
         Returns:
-            JSON response as dictionary
+            Raw response (status not checked)
         """
-        access_token = self.auth.get_valid_access_token()
-        headers = {
-            'Authorization': f'Bearer {access_token}'
-        }
+        if self._auth_header_stale():
+            self._update_auth_header()
         
         url = f"{self.base_url}{endpoint}"
-        response = requests.get(url, headers=headers, params=params)
+        response = self.session.get(url, headers=headers, params=params)
         
         # Track rate limits
         self.rate_limit_remaining = response.headers.get('X-RateLimit-Remaining')
         self.rate_limit_reset = response.headers.get('X-RateLimit-Reset')
         
+        return response
+    
+    def _auth_header_stale(self) -> bool:
+        """Check whether the token changed on the auth object or may need refreshing."""
+        return self.auth.tokens.get('access_token') != self._access_token or time.monotonic() >= self._token_check_at
+    
+    def _update_auth_header(self):
+        """
+        Set the session's Authorization header from a valid access token.
+        
+        Also schedules the next expiry check for when the token enters
+        WhoopAuth's refresh window, so requests until then skip it.
+        """
+        # Refresh tokens are single-use, so only one thread may refresh; the
+        # others wait and then find the header already up to date
+        with self._token_lock:
+            if not self._auth_header_stale():
+                return
+            
+            access_token = self.auth.get_valid_access_token()
+            
+            # Only touch the session headers when the token has been refreshed
+            if access_token != self._access_token:
+                self.session.headers.update({'Authorization': f'Bearer {access_token}'})
+                self._access_token = access_token
+            
+            expiry = datetime.fromisoformat(self.auth.tokens['expires_at'])
+            remaining = expiry - timedelta(minutes=5) - datetime.now()
+            self._token_check_at = time.monotonic() + remaining.total_seconds()
+    
+    def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
+        """
+        Make authenticated request to Whoop API.
+        
+        Args:
+            endpoint: API endpoint path
+            params: Query parameters
+            
+        Returns:
+            JSON response as dictionary
+        """
+        response = self._get(endpoint, params)
         response.raise_for_status()
         return response.json()
     
@@ -58,39 +138,106 @@ class WhoopClient:
         
         params['limit'] = min(limit, 25)
         all_records = []
-        next_token = None
         
         while True:
-            if next_token:
-                params['nextToken'] = next_token
-            
             response = self._make_request(endpoint, params)
             
-            # Handle different response structures
-            records = response.get('records', [])
-            if not records:
-                # Some endpoints return data directly
-                if isinstance(response, list):
-                    all_records.extend(response)
-                    break
-                elif isinstance(response, dict) and len(response) > 0:
-                    all_records.append(response)
-                    break
-            else:
-                all_records.extend(records)
-            
-            # Check for next page
-            next_token = response.get('next_token')
+            next_token = self._collect_page(response, all_records)
             if not next_token:
                 break
+            params['nextToken'] = next_token
+        
+        return all_records
+    
+    def _collect_page(self, response, all_records: List[Dict]) -> Optional[str]:
+        """
+        Add the records of one page to all_records.
+        
+        Args:
+            response: Parsed JSON of one page
+            all_records: Records collected so far (extended in place)
             
-            print(f"Fetched {len(all_records)} records, continuing pagination...")
+        Returns:
+            Token of the next page, or None if this was the last page
+        """
+        # Handle different response structures
+        records = response.get('records', [])
+        if not records:
+            # Some endpoints return data directly
+            if isinstance(response, list):
+                all_records.extend(response)
+                return None
+            elif isinstance(response, dict) and len(response) > 0:
+                all_records.append(response)
+                return None
+        else:
+            all_records.extend(records)
+        
+        # Check for next page
+        return response.get('next_token')
+    
+    async def _make_request_async(self, client: 'httpx.AsyncClient', endpoint: str,
+                                  params: Optional[Dict] = None) -> Dict:
+        """
+        Make authenticated request to Whoop API over an async client.
+        
+        Args:
+            client: Async client carrying the Authorization header
+            endpoint: API endpoint path
+            params: Query parameters
+            
+        Returns:
+            JSON response as dictionary
+        """
+        response = await client.get(f"{self.base_url}{endpoint}", params=params)
+        
+        # Track rate limits
+        self.rate_limit_remaining = response.headers.get('X-RateLimit-Remaining')
+        self.rate_limit_reset = response.headers.get('X-RateLimit-Reset')
+        
+        response.raise_for_status()
+        return response.json()
+    
+    async def _paginate_request_async(self, client: 'httpx.AsyncClient', endpoint: str,
+                                      params: Optional[Dict] = None, limit: int = 25) -> List[Dict]:
+        """
+        Async counterpart of _paginate_request.
+        
+        Args:
+            client: Async client carrying the Authorization header
+            endpoint: API endpoint path
+            params: Query parameters
+            limit: Records per page (max 25)
+            
+        Returns:
+            List of all records
+        """
+        params = dict(params or {})
+        params['limit'] = min(limit, 25)
+        all_records = []
+        
+        while True:
+            response = await self._make_request_async(client, endpoint, params)
+            
+            next_token = self._collect_page(response, all_records)
+            if not next_token:
+                break
+            params['nextToken'] = next_token
         
         return all_records
     
     def get_user_profile(self) -> Dict:
-        """Get user profile information."""
-        return self._make_request('/v2/user/profile/basic')
+        """Get user profile information, revalidating the last response via ETag."""
+        headers = {'If-None-Match': self._profile_etag} if self._profile_etag else None
+        response = self._get('/v2/user/profile/basic', headers=headers)
+        
+        if response.status_code == 304 and self._profile is not None:
+            return self._profile
+        
+        response.raise_for_status()
+        self._profile = response.json()
+        self._profile_etag = response.headers.get('ETag')
+        return self._profile
     
     def get_body_measurements(self) -> Dict:
         """Get user body measurements (height, weight, max HR)."""
@@ -175,7 +322,7 @@ class WhoopClient:
         Returns:
             Dictionary with keys: recovery, sleep, cycles, workouts
         """
-        print(f"Fetching Whoop data from {start} to {end}...")
+        logger.info(f"Fetching Whoop data from {start} to {end}...")
         
         # Add time component to dates
         start_dt = f"{start}T00:00:00.000Z"
@@ -188,32 +335,82 @@ class WhoopClient:
             'workouts': []
         }
         
-        try:
-            print("Fetching recovery data...")
-            data['recovery'] = self.get_recovery_data(start_dt, end_dt)
-            print(f"✓ Retrieved {len(data['recovery'])} recovery records")
-        except Exception as e:
-            print(f"✗ Error fetching recovery data: {e}")
+        fetchers = [
+            ('recovery', 'recovery', self.get_recovery_data),
+            ('sleep', 'sleep', self.get_sleep_data),
+            ('cycles', 'cycle', self.get_cycle_data),
+            ('workouts', 'workout', self.get_workout_data)
+        ]
         
+        # Check the token once up front so a missing or unrefreshable token fails before any fetch
         try:
-            print("Fetching sleep data...")
-            data['sleep'] = self.get_sleep_data(start_dt, end_dt)
-            print(f"✓ Retrieved {len(data['sleep'])} sleep records")
+            self._update_auth_header()
         except Exception as e:
-            print(f"✗ Error fetching sleep data: {e}")
+            logger.error(f"✗ Error getting access token: {e}")
+            return data
         
-        try:
-            print("Fetching cycle data...")
-            data['cycles'] = self.get_cycle_data(start_dt, end_dt)
-            print(f"✓ Retrieved {len(data['cycles'])} cycle records")
-        except Exception as e:
-            print(f"✗ Error fetching cycle data: {e}")
+        # The endpoints are independent and I/O-bound, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=len(fetchers)) as executor:
+            futures = {}
+            for key, label, fetch in fetchers:
+                logger.info(f"Fetching {label} data...")
+                futures[key] = (label, executor.submit(fetch, start_dt, end_dt))
+            
+            for key, (label, future) in futures.items():
+                try:
+                    data[key] = future.result()
+                    logger.info(f"✓ Retrieved {len(data[key])} {label} records")
+                except Exception as e:
+                    logger.error(f"✗ Error fetching {label} data: {e}")
         
-        try:
-            print("Fetching workout data...")
-            data['workouts'] = self.get_workout_data(start_dt, end_dt)
-            print(f"✓ Retrieved {len(data['workouts'])} workout records")
-        except Exception as e:
-            print(f"✗ Error fetching workout data: {e}")
+        return data
+    
+    async def get_all_health_data_async(self, start: str, end: str) -> Dict[str, List[Dict]]:
+        """
+        Fetch all health data types concurrently over a single HTTP/2 connection.
+        
+        Requires httpx with the http2 extra, which is optional and not in
+        requirements.txt. Unlike get_all_health_data, requests are not retried.
+        
+        Args:
+            start: Start date in ISO 8601 format (YYYY-MM-DD)
+            end: End date in ISO 8601 format (YYYY-MM-DD)
+            
+        Returns:
+            Dictionary with keys: recovery, sleep, cycles, workouts
+        """
+        if httpx is None:
+            raise ImportError("httpx is required for async fetching. Install it with: pip install 'httpx[http2]'")
+        
+        logger.info(f"Fetching Whoop data from {start} to {end}...")
+        
+        params = {
+            'start': f"{start}T00:00:00.000Z",
+            'end': f"{end}T23:59:59.999Z"
+        }
+        endpoints = {
+            'recovery': '/v2/recovery',
+            'sleep': '/v2/activity/sleep',
+            'cycles': '/v2/cycle',
+            'workouts': '/v2/activity/workout'
+        }
+        
+        access_token = self.auth.get_valid_access_token()
+        headers = {'Authorization': f'Bearer {access_token}'}
+        
+        async with httpx.AsyncClient(http2=True, headers=headers) as client:
+            results = await asyncio.gather(
+                *(self._paginate_request_async(client, endpoint, params) for endpoint in endpoints.values()),
+                return_exceptions=True
+            )
+        
+        data = {}
+        for key, result in zip(endpoints, results):
+            if isinstance(result, Exception):
+                logger.error(f"✗ Error fetching {key} data: {result}")
+                data[key] = []
+            else:
+                logger.info(f"✓ Retrieved {len(result)} {key} records")
+                data[key] = result
         
         return data